@@ -2,6 +2,7 @@ import customtkinter as ctk
 import tkinter as tk
 from tkinter import filedialog, messagebox
 import threading
+import queue
 import os
 from pathlib import Path
 import sys
@@ -25,13 +26,26 @@ class VideoConverterApp:
         
         # Initialize components
         self.ffmpeg_handler = FFmpegHandler()
-        self.video_processor = VideoProcessor()
+        self.video_processor = VideoProcessor(self.ffmpeg_handler)
         self.selected_files = []
+        self._file_entries = []  # (Path, detected format) for each selected file
         self.output_folder = ""
-        self.conversion_threads = []
+        self.conversion_running = False
+        
+        # Callbacks posted by worker threads, run on the Tk thread by poll_queue
+        self.ui_queue = queue.Queue()
+        
+        # Log lines waiting to be written to progress_text by _flush_log
+        self._log_queue = []
+        self._log_flush_pending = False
+        
+        # Background tasks run one after another on a single worker thread
+        self.task_queue = queue.Queue()
+        threading.Thread(target=self._run_tasks, daemon=True).start()
         
         # Setup UI
         self.setup_ui()
+        self.poll_queue()
         
         # Check FFmpeg installation on startup
         self.check_ffmpeg_status()
@@ -175,14 +189,26 @@ class VideoConverterApp:
         )
         self.progress_text.pack(fill="both", expand=True, padx=15, pady=(0, 15))
     
+    def _run_tasks(self):
+        """Worker loop executing background tasks from task_queue"""
+        while True:
+            task = self.task_queue.get()
+            try:
+                task()
+            except Exception as e:
+                print(f"Background task failed: {e}")
+    
+    def run_in_background(self, task):
+        """Queue a callable to run off the Tk thread"""
+        self.task_queue.put(task)
+    
     def check_ffmpeg_status(self):
         """Check if FFmpeg is installed and update UI accordingly"""
-        def check_thread():
+        def check_task():
             is_installed = self.ffmpeg_handler.is_ffmpeg_installed()
-            self.root.after(0, self.update_ffmpeg_status, is_installed)
+            self.ui_queue.put((self.update_ffmpeg_status, (is_installed,)))
         
-        thread = threading.Thread(target=check_thread, daemon=True)
-        thread.start()
+        self.run_in_background(check_task)
     
     def update_ffmpeg_status(self, is_installed):
         """Update FFmpeg status in UI"""
@@ -205,15 +231,14 @@ class VideoConverterApp:
         self.install_ffmpeg_btn.configure(state="disabled", text="Installing...")
         self.log_progress("Installing FFmpeg... This may take a few minutes.")
         
-        def install_thread():
+        def install_task():
             try:
                 success = self.ffmpeg_handler.install_ffmpeg()
-                self.root.after(0, self.ffmpeg_install_complete, success)
+                self.ui_queue.put((self.ffmpeg_install_complete, (success,)))
             except Exception as e:
-                self.root.after(0, self.ffmpeg_install_error, str(e))
+                self.ui_queue.put((self.ffmpeg_install_error, (str(e),)))
         
-        thread = threading.Thread(target=install_thread, daemon=True)
-        thread.start()
+        self.run_in_background(install_task)
     
     def ffmpeg_install_complete(self, success):
         """Handle FFmpeg installation completion"""
@@ -243,17 +268,20 @@ class VideoConverterApp:
         
         if files:
             self.selected_files = list(files)
+            # Detect formats once here rather than on every listbox refresh
+            self._file_entries = [
+                (Path(file_path), self.video_processor.detect_format(file_path))
+                for file_path in self.selected_files
+            ]
             self.update_files_listbox()
             self.check_conversion_ready()
     
     def update_files_listbox(self):
         """Update the files listbox with selected files"""
+        # Show filename and detected format, inserted in a single Tcl call
+        items = [f"{path.name} ({detected_format})" for path, detected_format in self._file_entries]
         self.files_listbox.delete(0, tk.END)
-        for file_path in self.selected_files:
-            # Show filename and detected format
-            filename = os.path.basename(file_path)
-            detected_format = self.video_processor.detect_format(file_path)
-            self.files_listbox.insert(tk.END, f"{filename} ({detected_format})")
+        self.files_listbox.insert(tk.END, *items)
     
     def select_output_folder(self):
         """Select output folder"""
@@ -276,9 +304,32 @@ class VideoConverterApp:
     
     def log_progress(self, message):
         """Add message to progress log"""
-        self.progress_text.insert("end", f"{message}\n")
+        self._log_queue.append(message)
+        if not self._log_flush_pending:
+            # Coalesce bursts of messages into one text insert (~30 Hz)
+            self._log_flush_pending = True
+            self.root.after(33, self._flush_log)
+    
+    def _flush_log(self):
+        """Write queued log messages to the progress text in one insert"""
+        self._log_flush_pending = False
+        if not self._log_queue:
+            return
+        self.progress_text.insert("end", "\n".join(self._log_queue) + "\n")
+        self._log_queue.clear()
         self.progress_text.see("end")
-        self.root.update_idletasks()
+    
+    def poll_queue(self):
+        """Run callbacks queued by worker threads on the Tk main thread"""
+        try:
+            while True:
+                callback, args = self.ui_queue.get_nowait()
+                callback(*args)
+        except queue.Empty:
+            pass
+        finally:
+            # Keep polling even if a callback raised, or the UI stops updating
+            self.root.after(100, self.poll_queue)
     
     def start_conversion(self):
         """Start the video conversion process"""
@@ -292,74 +343,77 @@ class VideoConverterApp:
         
         # Disable convert button during conversion
         self.convert_btn.configure(state="disabled", text="Converting...")
+        self.conversion_running = True
         
         # Clear previous progress
+        self._log_queue.clear()
         self.progress_text.delete("1.0", "end")
         
         output_format = self.format_dropdown.get()
+        input_files = list(self.selected_files)
+        output_folder = self.output_folder
         
-        def conversion_thread():
+        def progress_callback(input_file, percent):
+            filename = os.path.basename(input_file)
+            self.ui_queue.put((self.log_progress, (f"  {filename}: {percent:.1f}%",)))
+        
+        def conversion_task():
             try:
-                for i, input_file in enumerate(self.selected_files):
+                pool_size, _ = self.video_processor.plan_batch(input_files, output_format)
+                self.ui_queue.put((
+                    self.log_progress,
+                    (f"Converting {len(input_files)} file(s), {pool_size} at a time...",)
+                ))
+                
+                results = self.video_processor.convert_batch(
+                    input_files,
+                    output_folder,
+                    output_format,
+                    progress_callback
+                )
+                for input_file, output_file, success in results:
                     filename = os.path.basename(input_file)
-                    self.root.after(0, self.log_progress, f"Converting {filename}...")
-                    
-                    # Generate output filename
-                    base_name = os.path.splitext(filename)[0]
-                    output_file = os.path.join(self.output_folder, f"{base_name}.{output_format}")
-                    
-                    # Progress callback
-                    def progress_callback(percent):
-                        self.root.after(0, self.log_progress, f"  Progress: {percent:.1f}%")
-                    
-                    # Convert file
-                    success = self.video_processor.convert_video(
-                        input_file, 
-                        output_file, 
-                        output_format,
-                        progress_callback
-                    )
-                    
                     if success:
-                        self.root.after(0, self.log_progress, f"✅ {filename} converted successfully!")
+                        self.ui_queue.put((self.log_progress, (f"✅ {filename} converted successfully!",)))
                     else:
-                        self.root.after(0, self.log_progress, f"❌ Failed to convert {filename}")
+                        self.ui_queue.put((self.log_progress, (f"❌ Failed to convert {filename}",)))
                 
                 # Conversion complete
-                self.root.after(0, self.conversion_complete)
+                self.ui_queue.put((self.conversion_complete, ()))
                 
             except Exception as e:
-                self.root.after(0, self.conversion_error, str(e))
+                self.ui_queue.put((self.conversion_error, (str(e),)))
         
-        # Start conversion in separate thread
-        thread = threading.Thread(target=conversion_thread, daemon=True)
-        thread.start()
-        self.conversion_threads.append(thread)
+        # Reset cancellation here on the Tk thread, so a close during batch
+        # planning can't be undone once the task starts
+        self.video_processor.begin_batch()
+        self.run_in_background(conversion_task)
     
     def conversion_complete(self):
         """Handle conversion completion"""
+        self.conversion_running = False
         self.log_progress("\n🎉 All conversions completed!")
         self.convert_btn.configure(state="normal", text="🚀 Start Conversion")
         messagebox.showinfo("Complete", "All video conversions completed successfully!")
     
     def conversion_error(self, error_msg):
         """Handle conversion error"""
+        self.conversion_running = False
         self.log_progress(f"\n❌ Conversion error: {error_msg}")
         self.convert_btn.configure(state="normal", text="🚀 Start Conversion")
         messagebox.showerror("Error", f"Conversion failed: {error_msg}")
     
     def on_closing(self):
         """Handle application closing"""
-        # Wait for any ongoing conversions to complete
-        for thread in self.conversion_threads:
-            if thread.is_alive():
-                response = messagebox.askyesno(
-                    "Conversion in Progress", 
-                    "Video conversion is in progress. Are you sure you want to exit?"
-                )
-                if not response:
-                    return
-                break
+        if self.conversion_running:
+            response = messagebox.askyesno(
+                "Conversion in Progress", 
+                "Video conversion is in progress. Are you sure you want to exit?"
+            )
+            if not response:
+                return
+            # Stop running encodes so exit doesn't wait on the conversion pool
+            self.video_processor.cancel()
         
         self.root.destroy()
     
@@ -2,13 +2,76 @@ import subprocess
 import os
 import platform
 import shutil
-import re
 import urllib.request
+import urllib.error
+import http.client
 import zipfile
 import tarfile
 import tempfile
+import time
+import threading
+import functools
+import json
+import ctypes
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+try:
+    import numpy as np
+    from numba import njit
+except ImportError:  # Numba is optional; the pure-Python progress scanner is used instead
+    njit = None
+
+# Fewest encoder threads a single job should get when files run in parallel
+MIN_FFMPEG_THREADS = 2
+
+# Minimum seconds between progress callbacks for a single conversion
+PROGRESS_INTERVAL = 0.1
+
+# Prefix of the -progress line carrying encoded time, matched as raw bytes
+PROGRESS_TIME_PREFIX = b"out_time_us="
+PROGRESS_READ_SIZE = 4096
+
+# Bytes of ffmpeg's stderr to show when a conversion fails
+ERROR_LOG_TAIL = 2000
+
+# MP4-family containers that get their moov atom moved up front for streaming
+FASTSTART_FORMATS = {"mp4", "m4v", "mov"}
+
+# Download chunk size and how many times to resume a dropped FFmpeg download
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+DOWNLOAD_RETRIES = 3
+
+# Containers that can take H.264 video and these audio codecs without re-encoding
+STREAM_COPY_FORMATS = {"mp4", "mkv", "mov", "m4v"}
+STREAM_COPY_AUDIO_CODECS = {"aac", "mp3"}
+
+# (input args, output video args) for each H.264 encoder we know how to drive
+H264_ENCODER_ARGS = {
+    "libx264": ([], ["-c:v", "libx264", "-preset", "medium", "-crf", "23"]),
+    "h264_videotoolbox": ([], ["-c:v", "h264_videotoolbox", "-q:v", "65"]),
+    "h264_nvenc": ([], ["-c:v", "h264_nvenc", "-preset", "p4", "-tune", "hq", "-cq", "23"]),
+    "h264_qsv": ([], ["-c:v", "h264_qsv", "-global_quality", "23"]),
+    "h264_vaapi": (
+        ["-vaapi_device", "/dev/dri/renderD128"],
+        ["-vf", "format=nv12,hwupload", "-c:v", "h264_vaapi", "-qp", "23"]
+    ),
+}
+
+# Concurrent sessions allowed for hardware encoders with driver-imposed limits
+# (consumer NVIDIA cards cap NVENC sessions; QSV degrades past a couple)
+HW_ENCODER_MAX_SESSIONS = {
+    "h264_nvenc": 2,
+    "h264_qsv": 2,
+}
+
+# Hardware encoders to try on each platform, fastest first
+HW_ENCODER_PREFERENCE = {
+    "darwin": ["h264_videotoolbox"],
+    "windows": ["h264_nvenc", "h264_qsv"],
+    "linux": ["h264_nvenc", "h264_vaapi", "h264_qsv"],
+}
+
 class FFmpegHandler:
     """Handles FFmpeg installation and detection across platforms"""
     
@@ -19,14 +82,82 @@ class FFmpegHandler:
             "darwin": "https://evermeet.cx/ffmpeg/ffmpeg-6.0.zip",  # macOS
             "linux": None  # Will use package manager
         }
+        self._verified_binaries = {}  # (path, mtime) -> result of running "ffmpeg -version"
+        self._hw_encoders = None
+        self._h264_encoder = None
+        self._encoder_lock = threading.Lock()
     
     def is_ffmpeg_installed(self):
         """Check if FFmpeg is installed and accessible"""
+        # Not on PATH at all - no need to spawn anything
+        path = shutil.which("ffmpeg")
+        if path is None:
+            return False
+        
+        # Only run the binary once per (path, mtime); a stat is enough after that
+        try:
+            cache_key = (path, os.path.getmtime(path))
+        except OSError:
+            return False
+        if cache_key in self._verified_binaries:
+            return self._verified_binaries[cache_key]
+        
         try:
             result = subprocess.run(
-                ["ffmpeg", "-version"], 
+                [path, "-version"], 
                 capture_output=True, 
-                text=True, 
+                timeout=10
+            )
+        except (subprocess.TimeoutExpired, FileNotFoundError, subprocess.SubprocessError):
+            return False
+        
+        self._verified_binaries[cache_key] = result.returncode == 0
+        return result.returncode == 0
+    
+    def detect_hw_encoders(self):
+        """Return the hardware H.264 encoders compiled into this ffmpeg build"""
+        if self._hw_encoders is not None:
+            return self._hw_encoders
+        
+        encoders = set()
+        try:
+            result = subprocess.run(
+                ["ffmpeg", "-hide_banner", "-encoders"],
+                capture_output=True,
+                text=True,
+                timeout=10
+            )
+            for line in result.stdout.splitlines():
+                fields = line.split()
+                if len(fields) >= 2 and fields[1] in H264_ENCODER_ARGS and fields[1] != "libx264":
+                    encoders.add(fields[1])
+        except (subprocess.TimeoutExpired, FileNotFoundError, subprocess.SubprocessError):
+            pass
+        
+        self._hw_encoders = encoders
+        return encoders
+    
+    def get_h264_encoder(self):
+        """Pick the fastest working H.264 encoder, falling back to libx264"""
+        with self._encoder_lock:
+            if self._h264_encoder is None:
+                self._h264_encoder = "libx264"
+                available = self.detect_hw_encoders()
+                for name in HW_ENCODER_PREFERENCE.get(self.system, []):
+                    if name in available and self._encoder_works(name):
+                        self._h264_encoder = name
+                        break
+            return self._h264_encoder
+    
+    def _encoder_works(self, name):
+        """Encode a few blank frames to check the encoder's hardware is actually present"""
+        input_args, video_args = H264_ENCODER_ARGS[name]
+        try:
+            result = subprocess.run(
+                ["ffmpeg", "-hide_banner", "-loglevel", "error", *input_args,
+                 "-f", "lavfi", "-i", "color=c=black:s=256x256:d=0.1",
+                 *video_args, "-f", "null", "-"],
+                capture_output=True,
                 timeout=10
             )
             return result.returncode == 0
@@ -37,17 +168,22 @@ class FFmpegHandler:
         """Install FFmpeg based on the operating system"""
         try:
             if self.system == "windows":
-                return self._install_ffmpeg_windows()
+                success = self._install_ffmpeg_windows()
             elif self.system == "darwin":  # macOS
-                return self._install_ffmpeg_macos()
+                success = self._install_ffmpeg_macos()
             elif self.system == "linux":
-                return self._install_ffmpeg_linux()
+                success = self._install_ffmpeg_linux()
             else:
                 print(f"Unsupported platform: {self.system}")
                 return False
         except Exception as e:
             print(f"FFmpeg installation failed: {e}")
             return False
+        
+        if success:
+            # Re-verify the freshly installed binary on the next check
+            self._verified_binaries.clear()
+        return success
     
     def _install_ffmpeg_windows(self):
         """Install FFmpeg on Windows"""
@@ -58,15 +194,14 @@ class FFmpegHandler:
         ffmpeg_dir.mkdir(exist_ok=True)
         
         # Download FFmpeg
-        with tempfile.TemporaryDirectory() as temp_dir:
-            zip_path = Path(temp_dir) / "ffmpeg.zip"
-            
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                tempfile.SpooledTemporaryFile(max_size=16 * DOWNLOAD_CHUNK_SIZE) as zip_file:
             print("Downloading FFmpeg...")
-            urllib.request.urlretrieve(self.ffmpeg_urls["windows"], zip_path)
+            self._download(self.ffmpeg_urls["windows"], zip_file)
             
             print("Extracting FFmpeg...")
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
+            # Only the executables are needed, skip docs and presets
+            self._extract_zip(zip_file, temp_dir, lambda name: "/bin/" in name)
             
             # Find the extracted folder
             extracted_folders = [d for d in Path(temp_dir).iterdir() if d.is_dir()]
@@ -83,7 +218,7 @@ class FFmpegHandler:
             destination_bin = ffmpeg_dir / "bin"
             if destination_bin.exists():
                 shutil.rmtree(destination_bin)
-            shutil.copytree(bin_dir, destination_bin)
+            self._copy_tree(bin_dir, destination_bin)
         
         # Add to PATH
         self._add_to_path_windows(str(destination_bin))
@@ -110,15 +245,13 @@ class FFmpegHandler:
         ffmpeg_dir = Path.home() / "ffmpeg"
         ffmpeg_dir.mkdir(exist_ok=True)
         
-        with tempfile.TemporaryDirectory() as temp_dir:
-            zip_path = Path(temp_dir) / "ffmpeg.zip"
-            
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                tempfile.SpooledTemporaryFile(max_size=16 * DOWNLOAD_CHUNK_SIZE) as zip_file:
             print("Downloading FFmpeg...")
-            urllib.request.urlretrieve(self.ffmpeg_urls["darwin"], zip_path)
+            self._download(self.ffmpeg_urls["darwin"], zip_file)
             
             print("Extracting FFmpeg...")
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
+            self._extract_zip(zip_file, temp_dir)
             
             # Copy ffmpeg binary
             ffmpeg_binary = Path(temp_dir) / "ffmpeg"
@@ -140,43 +273,114 @@ class FFmpegHandler:
         
         # Try different package managers
         package_managers = [
-            (["apt", "update"], ["apt", "install", "-y", "ffmpeg"]),  # Ubuntu/Debian
-            (["yum", "check-update"], ["yum", "install", "-y", "ffmpeg"]),  # CentOS/RHEL
-            (["dnf", "check-update"], ["dnf", "install", "-y", "ffmpeg"]),  # Fedora
-            (["pacman", "-Sy"], ["pacman", "-S", "--noconfirm", "ffmpeg"]),  # Arch
-            (["zypper", "refresh"], ["zypper", "install", "-y", "ffmpeg"])  # openSUSE
+            ("apt", ["apt", "update"], ["apt", "install", "-y", "ffmpeg"]),  # Ubuntu/Debian
+            ("yum", ["yum", "check-update"], ["yum", "install", "-y", "ffmpeg"]),  # CentOS/RHEL
+            ("dnf", ["dnf", "check-update"], ["dnf", "install", "-y", "ffmpeg"]),  # Fedora
+            ("pacman", ["pacman", "-Sy"], ["pacman", "-S", "--noconfirm", "ffmpeg"]),  # Arch
+            ("zypper", ["zypper", "refresh"], ["zypper", "install", "-y", "ffmpeg"])  # openSUSE
         ]
         
-        for update_cmd, install_cmd in package_managers:
-            try:
-                # Test if package manager exists
-                subprocess.run(update_cmd[:1] + ["--version"], capture_output=True, check=True)
-                
-                print(f"Using {update_cmd[0]} package manager...")
-                
-                # Update package list
-                subprocess.run(update_cmd, capture_output=True, check=True)
-                
-                # Install FFmpeg
-                result = subprocess.run(install_cmd, capture_output=True, text=True)
-                
-                if result.returncode == 0:
-                    print("FFmpeg installation completed!")
-                    return True
-                
-            except (subprocess.CalledProcessError, FileNotFoundError):
+        for name, update_cmd, install_cmd in package_managers:
+            # PATH lookup only, no need to spawn the package manager to test for it
+            if shutil.which(name) is None:
                 continue
+            
+            print(f"Using {name} package manager...")
+            
+            # Update package list (yum/dnf check-update exits 100 when updates exist)
+            subprocess.run(update_cmd, capture_output=True)
+            
+            # Install FFmpeg
+            result = subprocess.run(install_cmd, capture_output=True, text=True)
+            
+            if result.returncode == 0:
+                print("FFmpeg installation completed!")
+                return True
         
         # If all package managers fail, try snap
-        try:
-            subprocess.run(["snap", "install", "ffmpeg"], capture_output=True, check=True)
-            return True
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            pass
+        if shutil.which("snap"):
+            result = subprocess.run(["snap", "install", "ffmpeg"], capture_output=True)
+            if result.returncode == 0:
+                return True
         
         print("Could not install FFmpeg automatically. Please install manually.")
         return False
     
+    def _download(self, url, fileobj):
+        """Stream url into fileobj in chunks, resuming with a Range request if the connection drops"""
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            offset = fileobj.tell()
+            request = urllib.request.Request(url)
+            if offset:
+                request.add_header("Range", f"bytes={offset}-")
+            
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    if offset and response.status != 206:
+                        # Server ignored the range, start over
+                        fileobj.seek(0)
+                        fileobj.truncate()
+                    
+                    # Total size from "Content-Range: bytes a-b/total" or Content-Length
+                    expected_size = None
+                    content_range = response.headers.get("Content-Range", "")
+                    content_length = response.headers.get("Content-Length")
+                    if response.status == 206 and "/" in content_range:
+                        total = content_range.rsplit("/", 1)[1]
+                        expected_size = int(total) if total.isdigit() else None
+                    elif content_length and content_length.isdigit():
+                        expected_size = int(content_length)
+                    
+                    while True:
+                        chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        fileobj.write(chunk)
+                
+                # read() returns b"" when the connection closes early, so check the size
+                written = fileobj.tell()
+                if expected_size is not None and written < expected_size:
+                    raise http.client.IncompleteRead(b"", expected_size - written)
+                
+                fileobj.seek(0)
+                return
+            except (OSError, http.client.IncompleteRead) as e:
+                # Client errors (404, 403, ...) won't go away by retrying
+                client_error = isinstance(e, urllib.error.HTTPError) and 400 <= e.code < 500
+                if client_error or attempt == DOWNLOAD_RETRIES:
+                    raise
+                print(f"Download interrupted ({e}), resuming at {fileobj.tell()} bytes...")
+    
+    def _extract_zip(self, fileobj, destination, include=None):
+        """Extract zip members in parallel; zlib releases the GIL while inflating"""
+        with zipfile.ZipFile(fileobj, 'r') as zip_ref:
+            names = [
+                name for name in zip_ref.namelist()
+                if not name.endswith("/") and (include is None or include(name))
+            ]
+            
+            # Create directories up front so workers don't race on makedirs
+            for name in names:
+                os.makedirs(os.path.join(destination, os.path.dirname(name)), exist_ok=True)
+            
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(lambda name: zip_ref.extract(name, destination), names))
+    
+    def _copy_tree(self, src, dst):
+        """Copy a directory using the OS copy fast path rather than Python buffers"""
+        dst.mkdir(parents=True, exist_ok=True)
+        for entry in src.iterdir():
+            target = dst / entry.name
+            if entry.is_dir():
+                self._copy_tree(entry, target)
+            elif self.system == "windows":
+                if not ctypes.windll.kernel32.CopyFileExW(str(entry), str(target), None, None, None, 0):
+                    raise ctypes.WinError()
+            else:
+                # copyfile uses sendfile on Linux and fcopyfile on macOS
+                shutil.copyfile(entry, target)
+                shutil.copymode(entry, target)
+    
     def _add_to_path_windows(self, path):
         """Add path to Windows PATH environment variable"""
         try:
@@ -224,11 +428,16 @@ class FFmpegHandler:
 class VideoProcessor:
     """Handles video processing and conversion"""
     
-    def __init__(self):
+    def __init__(self, ffmpeg_handler=None):
+        self.ffmpeg_handler = ffmpeg_handler or FFmpegHandler()
         self.supported_formats = {
             ".mp4", ".avi", ".mov", ".mkv", ".webm", ".flv", 
             ".wmv", ".m4v", ".3gp", ".mpg", ".mpeg", ".ts", ".mts"
         }
+        self._probe_cache = {}  # (path, mtime, size) -> _probe() result
+        self._processes = set()  # Running ffmpeg processes, for cancel()
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
     
     def detect_format(self, file_path):
         """Detect the format of a video file"""
@@ -238,96 +447,351 @@ class VideoProcessor:
                 return extension[1:]  # Remove the dot
             
             # Use ffprobe to detect format if extension is unknown
-            result = subprocess.run([
-                "ffprobe", "-v", "quiet", "-print_format", "json", 
-                "-show_format", file_path
-            ], capture_output=True, text=True, timeout=30)
-            
-            if result.returncode == 0:
-                import json
-                data = json.loads(result.stdout)
-                format_name = data.get("format", {}).get("format_name", "unknown")
-                return format_name.split(",")[0]  # Take first format if multiple
+            format_name = self._probe(file_path)["format_name"]
+            return format_name.split(",")[0]  # Take first format if multiple
             
         except Exception:
             pass
         
         return "unknown"
     
-    def convert_video(self, input_file, output_file, output_format, progress_callback=None):
+    def convert_video(self, input_file, output_file, output_format, progress_callback=None, threads=None, encoder=None):
         """Convert a video file to the specified format"""
+        if self._cancelled.is_set():
+            return False  # Skip probing and encoder detection once cancelled
+        
+        if _same_path(input_file, output_file):
+            print(f"Output same as input, not overwriting {input_file}")
+            return False
+        
         try:
+            # Pick codecs for the target format
+            input_args = []
+            # An explicit encoder forces a re-encode; the retries below rely on that
+            stream_copy = encoder is None and self._can_stream_copy(input_file, output_format)
+            if stream_copy:
+                # Source streams already fit the target container - just remux
+                codec_args = ["-c", "copy"]
+            elif output_format.lower() == "webm":
+                codec_args = ["-c:v", "libvpx-vp9", "-c:a", "libopus", "-crf", "23"]
+            else:
+                encoder = encoder or self.ffmpeg_handler.get_h264_encoder()
+                input_args, video_args = H264_ENCODER_ARGS[encoder]
+                codec_args = video_args + ["-c:a", "aac"]
+            
+            # Add container-specific options
+            container_input_args, muxer_options = _container_options(output_format)
+            input_args = [*container_input_args, *input_args]
+            container_args = [arg for name, value in muxer_options.items() for arg in (f"-{name}", value)]
+            
             # Build FFmpeg command
             cmd = [
-                "ffmpeg", "-i", input_file,
-                "-c:v", "libx264",  # Video codec
-                "-c:a", "aac",      # Audio codec
-                "-preset", "medium", # Encoding speed/quality balance
-                "-crf", "23",       # Quality (lower = better quality)
-                "-movflags", "+faststart",  # Web optimization
+                "ffmpeg", *input_args, "-i", input_file,
+                *codec_args,
+                *container_args,
                 "-y",               # Overwrite output file
                 output_file
             ]
             
-            # Add format-specific options
-            if output_format.lower() == "webm":
-                cmd[5:7] = ["-c:v", "libvpx-vp9", "-c:a", "libopus"]
-            elif output_format.lower() in ["mov", "m4v"]:
-                cmd[5:7] = ["-c:v", "libx264", "-c:a", "aac"]
-            
-            print(f"Running command: {' '.join(cmd)}")
+            # Report progress as key=value lines on stdout instead of stderr stats
+            cmd[1:1] = ["-progress", "pipe:1", "-nostats", "-loglevel", "error"]
             
-            # Run conversion with progress tracking
-            process = subprocess.Popen(
-                cmd, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE, 
-                universal_newlines=True
-            )
+            # Cap encoder threads so concurrent jobs don't oversubscribe cores
+            if threads:
+                cmd[-2:-2] = ["-threads", str(threads)]
             
-            # Parse progress from stderr
-            duration = self._get_video_duration(input_file)
+            print(f"Running command: {' '.join(cmd)}")
             
-            while True:
-                line = process.stderr.readline()
-                if not line:
-                    break
+            # Run conversion with progress tracking; errors go to a file so a
+            # chatty stderr can never fill a pipe nobody is reading
+            error_log = tempfile.TemporaryFile()
+            process = None
+            try:
+                with self._lock:
+                    if self._cancelled.is_set():
+                        return False
+                    process = subprocess.Popen(
+                        cmd, 
+                        stdout=subprocess.PIPE, 
+                        stderr=error_log, 
+                        bufsize=0
+                    )
+                    self._processes.add(process)
                 
-                if progress_callback and duration:
-                    time_match = re.search(r'time=(\d+):(\d+):(\d+)\.(\d+)', line)
-                    if time_match:
-                        hours, minutes, seconds, centiseconds = map(int, time_match.groups())
-                        current_time = hours * 3600 + minutes * 60 + seconds + centiseconds / 100
-                        progress = (current_time / duration) * 100
+                # Parse progress from the -progress key=value stream
+                duration = self._get_video_duration(input_file)
+                last_emit = 0.0
+                
+                # os.read on the raw fd blocks in C with the GIL released
+                fd = process.stdout.fileno()
+                buf = bytearray()
+                
+                while True:
+                    chunk = os.read(fd, PROGRESS_READ_SIZE)
+                    if not chunk:
+                        break
+                    if not (progress_callback and duration):
+                        continue
+                    
+                    buf += chunk
+                    time_us, consumed = _scan_progress(buf, 0)
+                    del buf[:consumed]  # Keep only the incomplete tail
+                    
+                    now = time.monotonic()
+                    if time_us >= 0 and now - last_emit >= PROGRESS_INTERVAL:
+                        last_emit = now
+                        progress = (time_us / 1_000_000 / duration) * 100
                         progress_callback(min(progress, 100))
+                
+                # Wait for process to complete
+                return_code = process.wait()
+                if return_code == 0 and os.path.exists(output_file):
+                    if progress_callback:
+                        progress_callback(100)
+                    return True
+                
+                # Only decode ffmpeg's error output once we know it's needed
+                error_log.seek(0)
+                errors = error_log.read()[-ERROR_LOG_TAIL:].decode("utf-8", "replace").strip()
+            finally:
+                error_log.close()
+                if process is not None:
+                    if process.poll() is None:
+                        # Something raised mid-read; don't leave ffmpeg running unattended
+                        process.kill()
+                        process.wait()
+                    process.stdout.close()
+                    with self._lock:
+                        self._processes.discard(process)
             
-            # Wait for process to complete
-            return_code = process.wait()
-            
-            if return_code == 0 and os.path.exists(output_file):
-                return True
-            else:
-                print(f"FFmpeg failed with return code: {return_code}")
-                return False
+            print(f"FFmpeg failed with return code: {return_code}")
+            if errors:
+                print(errors)
+            if stream_copy and not self._cancelled.is_set():
+                # Some sources won't remux cleanly (e.g. H.264 in AVI lacking timestamps)
+                print(f"Retrying {input_file} with re-encoding...")
+                return self.convert_video(
+                    input_file, output_file, output_format, progress_callback, threads,
+                    self.ffmpeg_handler.get_h264_encoder()
+                )
+            if encoder and encoder != "libx264" and not self._cancelled.is_set():
+                # Hardware encoders reject some inputs (e.g. 10-bit), retry on the CPU
+                print(f"Retrying {input_file} with libx264...")
+                return self.convert_video(
+                    input_file, output_file, output_format, progress_callback, threads, "libx264"
+                )
+            return False
                 
         except Exception as e:
             print(f"Conversion error: {e}")
             return False
     
-    def _get_video_duration(self, file_path):
-        """Get video duration in seconds"""
+    def convert_batch(self, input_files, output_dir, output_format, progress_callback=None, max_workers=None):
+        """Convert several files concurrently, yielding (input, output, success) as each finishes"""
+        max_workers, threads = self.plan_batch(input_files, output_format, max_workers)
+        
+        # Give each input its own output that is neither another job's output
+        # (inputs from different folders can share a basename) nor any source file
+        def normalize(path):
+            return os.path.normcase(os.path.realpath(path))
+        
+        output_paths = {}
+        used = {normalize(input_file) for input_file in input_files}
+        for input_file in input_files:
+            base_name = os.path.splitext(os.path.basename(input_file))[0]
+            output_file = os.path.join(output_dir, f"{base_name}.{output_format}")
+            suffix = 2
+            while normalize(output_file) in used:
+                output_file = os.path.join(output_dir, f"{base_name}_{suffix}.{output_format}")
+                suffix += 1
+            used.add(normalize(output_file))
+            output_paths[input_file] = output_file
+        
+        def convert_one(input_file):
+            output_file = output_paths[input_file]
+            
+            callback = None
+            if progress_callback:
+                callback = functools.partial(progress_callback, input_file)
+            
+            success = self.convert_video(input_file, output_file, output_format, callback, threads)
+            return input_file, output_file, success
+        
+        # Each job spends its time waiting on an ffmpeg child process, so
+        # threads are enough to keep several encoders busy at once
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(convert_one, f) for f in input_files]
+            for future in as_completed(futures):
+                yield future.result()
+    
+    def plan_batch(self, input_files, output_format, max_workers=None):
+        """Return (pool_size, ffmpeg_threads) for converting input_files to output_format"""
+        encodes_h264 = output_format.lower() != "webm" and not all(
+            self._can_stream_copy(input_file, output_format) for input_file in input_files
+        )
+        if encodes_h264:
+            # Jobs beyond the encoder's session limit would fail and redo the work on libx264
+            limit = HW_ENCODER_MAX_SESSIONS.get(self.ffmpeg_handler.get_h264_encoder())
+            if limit:
+                max_workers = min(max_workers or limit, limit)
+        return plan_workers(len(input_files), max_workers)
+    
+    def begin_batch(self):
+        """Re-arm conversions after a cancel(); call before queuing a new batch"""
+        self._cancelled.clear()
+    
+    def cancel(self):
+        """Stop running conversions and skip any that haven't started"""
+        with self._lock:
+            self._cancelled.set()
+            for process in self._processes:
+                process.terminate()
+    
+    def _probe(self, file_path):
+        """Get format name, duration and stream codecs from a single ffprobe run"""
+        info = {"format_name": "unknown", "duration": None, "codec": None, "streams": ()}
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return info
+        
+        cache_key = (file_path, stat.st_mtime, stat.st_size)
+        if cache_key in self._probe_cache:
+            return self._probe_cache[cache_key]
+        
         try:
             result = subprocess.run([
-                "ffprobe", "-v", "quiet", "-print_format", "compact=p=0:nk=1",
-                "-show_entries", "format=duration", file_path
-            ], capture_output=True, text=True, timeout=30)
+                "ffprobe", "-v", "quiet", "-print_format", "json",
+                "-show_format", "-show_streams", file_path
+            ], capture_output=True, timeout=30)
             
             if result.returncode == 0:
-                duration_str = result.stdout.strip()
-                return float(duration_str) if duration_str else None
+                data = json.loads(result.stdout)
+                fmt = data.get("format", {})
+                info["format_name"] = fmt.get("format_name", "unknown")
+                if fmt.get("duration"):
+                    info["duration"] = float(fmt["duration"])
+                info["streams"] = tuple(
+                    (stream.get("codec_type"), stream.get("codec_name"))
+                    for stream in data.get("streams", [])
+                )
+                info["codec"] = next(
+                    (name for codec_type, name in info["streams"] if codec_type == "video"),
+                    None
+                )
         except Exception:
             pass
-        return None
+        
+        # Failures are cached too, so unreadable files aren't re-probed on every refresh
+        self._probe_cache[cache_key] = info
+        return info
+    
+    def _get_video_duration(self, file_path):
+        """Get video duration in seconds"""
+        return self._probe(file_path)["duration"]
+    
+    def _can_stream_copy(self, file_path, output_format):
+        """Check whether every stream can be copied into output_format as-is"""
+        if output_format.lower() not in STREAM_COPY_FORMATS:
+            return False
+        
+        info = self._probe(file_path)
+        if info["codec"] != "h264":
+            return False
+        
+        for codec_type, codec_name in info["streams"]:
+            if codec_type == "video" and codec_name != "h264":
+                return False
+            if codec_type == "audio" and codec_name not in STREAM_COPY_AUDIO_CODECS:
+                return False
+            if codec_type not in ("video", "audio"):
+                return False  # Subtitles/data may not fit the target container
+        return True
+
+
+def _container_options(output_format):
+    """Return (input args, muxer options) for the target container"""
+    if output_format.lower() in FASTSTART_FORMATS:
+        return [], {"movflags": "+faststart"}  # Web optimization
+    # Fill in missing timestamps and shift negative ones to zero
+    return ["-fflags", "+genpts"], {"avoid_negative_ts": "make_zero"}
+
+
+def _same_path(path_a, path_b):
+    """Check whether two paths name the same file, whether or not it exists yet"""
+    try:
+        if os.path.exists(path_a) and os.path.exists(path_b):
+            return os.path.samefile(path_a, path_b)
+    except OSError:
+        pass
+    return os.path.normcase(os.path.realpath(path_a)) == os.path.normcase(os.path.realpath(path_b))
+
+
+def plan_workers(job_count, max_workers=None):
+    """Return (pool_size, ffmpeg_threads) for running job_count conversions at once"""
+    cpu_count = os.cpu_count() or 1
+    if max_workers is None:
+        max_workers = max(1, cpu_count // MIN_FFMPEG_THREADS)
+    pool_size = max(1, min(max_workers, job_count))
+    return pool_size, max(1, cpu_count // pool_size)
+
+
+def _scan_progress_py(buf, start):
+    """Return (latest out_time_us or -1, offset past the last complete line) for -progress output"""
+    time_us = -1
+    value_start = len(PROGRESS_TIME_PREFIX)
+    while True:
+        end = buf.find(b"\n", start)
+        if end < 0:
+            return time_us, start
+        if buf.startswith(PROGRESS_TIME_PREFIX, start, end):
+            try:
+                time_us = int(buf[start + value_start:end])
+            except ValueError:
+                pass  # "N/A" until the first frame is written
+        start = end + 1
+
+
+if njit is not None:
+    _PROGRESS_TIME_PREFIX_ARRAY = np.frombuffer(PROGRESS_TIME_PREFIX, dtype=np.uint8)
+    
+    @njit(cache=True)
+    def _scan_progress_kernel(data, start, prefix):
+        """Compiled equivalent of _scan_progress_py over a uint8 array"""
+        time_us = -1
+        prefix_len = prefix.shape[0]
+        line_start = start
+        for i in range(start, data.shape[0]):
+            if data[i] != 10:  # "\n"
+                continue
+            
+            matched = i - line_start > prefix_len
+            for k in range(prefix_len):
+                if not matched:
+                    break
+                matched = data[line_start + k] == prefix[k]
+            
+            if matched:
+                value = 0
+                digits = 0
+                j = line_start + prefix_len
+                while j < i and 48 <= data[j] <= 57:  # ASCII digits
+                    value = value * 10 + (data[j] - 48)
+                    digits += 1
+                    j += 1
+                if digits:
+                    time_us = value
+            line_start = i + 1
+        return time_us, line_start
+    
+    def _scan_progress(buf, start):
+        """Numba-compiled progress scanner, same contract as _scan_progress_py"""
+        time_us, consumed = _scan_progress_kernel(
+            np.frombuffer(buf, dtype=np.uint8), start, _PROGRESS_TIME_PREFIX_ARRAY
+        )
+        return int(time_us), int(consumed)
+else:
+    _scan_progress = _scan_progress_py
 
 
 def main():